@@ -1,7 +1,13 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from functools import lru_cache
 
 class Settings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        case_sensitive=True,
+        frozen=True
+    )
+    
     # API Configuration
     API_TITLE: str = "SPC Suggestion API"
     API_VERSION: str = "1.0.0"
@@ -15,21 +21,21 @@ class Settings(BaseSettings):
     GEMINI_MODEL: str = "gemini-2.5-pro"  # Changed from "gemini-1.5-pro"
     GEMINI_TEMPERATURE: float = 0.2
     GEMINI_MAX_TOKENS: int = 4096
+    # Number of processed Gemini responses kept for identical prompts
+    GEMINI_CACHE_SIZE: int = 128
+    # Build response models from post-processed Gemini output without
+    # validation (model_construct). Only enable if that output is trusted.
+    TRUST_GEMINI_SCHEMA: bool = False
     
     # CORS Configuration
-    ALLOWED_ORIGINS: list = [
-        "*",
-        "https://*.dynamics.com",
-        "https://*.crm.dynamics.com",
-        "http://localhost:3000"  # For local testing
-    ]
+    # Exact origins only - CORSMiddleware does not expand "https://*.dynamics.com"
+    # style patterns, and any entry is moot while "*" is present.
+    ALLOWED_ORIGINS: list = ["*"]
+    # Seconds browsers may cache a preflight (Chromium caps this at 7200)
+    CORS_MAX_AGE: int = 7200
     
     # Rate Limiting
     MAX_REQUESTS_PER_MINUTE: int = 10
-    
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
 
 @lru_cache()
 def get_settings():
@@ -1,12 +1,16 @@
 import google.generativeai as genai
 from app.config import get_settings
+from app.models import ItemInput, ItemAnalysisList
 from app.prompts import build_suggestion_prompt
-import json
+from pydantic import ValidationError
+import orjson
 import re
+import copy
+import hashlib
+from collections import OrderedDict
+from itertools import islice
 from typing import List, Dict
 import logging
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -14,8 +18,8 @@ settings = get_settings()
 # Configure Gemini
 genai.configure(api_key=settings.GOOGLE_API_KEY)
 
-# Thread pool for running sync Gemini calls
-executor = ThreadPoolExecutor(max_workers=5)
+# Pattern used by GeminiService._extract_json, compiled once at import
+_JSON_BLOCK_RE = re.compile(rb'```(?:json)?\s*(\{[\s\S]*?\})\s*```')
 
 class GeminiService:
     def __init__(self):
@@ -26,39 +30,44 @@ class GeminiService:
                 "max_output_tokens": settings.GEMINI_MAX_TOKENS,
             }
         )
+        # LRU of processed results keyed by a hash of the prompt
+        self._cache = OrderedDict()
     
     async def generate_suggestions(
         self, 
-        items: List[Dict], 
+        items: List[ItemInput], 
         sub_grid: str, 
         procedure_type: str = None
     ) -> Dict:
         """
         Calls Gemini API to generate suggestions for items.
-        Runs the synchronous Gemini call in a thread pool to avoid blocking.
+        Uses the SDK's async client so the call never blocks the event loop.
+        Identical prompts are served from an in-memory LRU cache.
         """
         try:
             prompt = build_suggestion_prompt(items, sub_grid, procedure_type)
             
-            logger.info(f"Calling Gemini for {len(items)} items in {sub_grid}")
-            logger.info(f"Prompt length: {len(prompt)} characters")
-            logger.debug(f"Prompt preview: {prompt[:300]}")
+            cache_key = hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+                logger.info("Cache hit for %d items in %s", len(items), sub_grid)
+                return copy.deepcopy(cached)
             
-            # Run synchronous Gemini call in thread pool
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                executor,
-                self._call_gemini_sync,
-                prompt
-            )
+            logger.info("Calling Gemini for %d items in %s", len(items), sub_grid)
+            logger.info("Prompt length: %d characters", len(prompt))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Prompt preview: %s", prompt[:300])
+            
+            response = await self.model.generate_content_async(prompt)
             
             # Check if response has content
             if not response.candidates or len(response.candidates) == 0:
-                logger.error(f"Gemini returned no candidates. Finish reason: {response.prompt_feedback if hasattr(response, 'prompt_feedback') else 'unknown'}")
+                logger.error("Gemini returned no candidates. Finish reason: %s", getattr(response, 'prompt_feedback', 'unknown'))
                 raise ValueError("Gemini returned empty response - request may have been blocked by safety filters")
             
             candidate = response.candidates[0]
-            logger.info(f"Candidate finish_reason: {candidate.finish_reason}")
+            logger.info("Candidate finish_reason: %s", candidate.finish_reason)
             
             # Extract JSON from response
             if not candidate.content or not candidate.content.parts:
@@ -66,131 +75,162 @@ class GeminiService:
                 raise ValueError("Gemini returned no content - request blocked by safety filters")
             
             raw_text = candidate.content.parts[0].text
-            logger.info(f"Gemini response received (length: {len(raw_text)})")
-            logger.debug(f"Raw response preview: {raw_text[:300]}")
+            logger.info("Gemini response received (length: %d)", len(raw_text))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Raw response preview: %s", raw_text[:300])
             
-            # Parse JSON with improved extraction
-            result = self._extract_json(raw_text)
+            # Parse JSON with improved extraction (encode once, parse bytes)
+            result = self._extract_json(raw_text.encode('utf-8'))
             
             logger.info("JSON parsing successful")
             
             # Validate and enrich response
-            return self._process_gemini_response(result, items)
+            processed = self._process_gemini_response(result, items)
+            
+            # Only cache complete, schema-valid results so a bad reply gets retried
+            if len(processed["items"]) == len(items) and self._is_valid(processed):
+                self._cache[cache_key] = copy.deepcopy(processed)
+                if len(self._cache) > settings.GEMINI_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+            
+            return processed
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse Gemini response: {e}")
-            logger.error(f"Raw response: {raw_text[:500]}")
+        except orjson.JSONDecodeError as e:
+            logger.error("Failed to parse Gemini response: %s", e)
+            logger.error("Raw response: %s", raw_text[:500])
             raise ValueError(f"Gemini returned invalid JSON: {str(e)}")
         
         except Exception as e:
-            logger.error(f"Gemini API error: {e}", exc_info=True)
+            logger.error("Gemini API error: %s", e, exc_info=True)
             raise
     
-    def _call_gemini_sync(self, prompt: str):
+    def _is_valid(self, processed: Dict) -> bool:
         """
-        Synchronous wrapper for Gemini API call.
-        This runs in a thread pool to avoid blocking the event loop.
+        Checks processed items against the response schema before caching.
         """
         try:
-            response = self.model.generate_content(prompt)
-            return response
-        except Exception as e:
-            logger.error(f"Gemini SDK error: {e}", exc_info=True)
-            raise
+            ItemAnalysisList.validate_python(processed["items"])
+        except ValidationError as e:
+            logger.warning("Not caching Gemini result with %d invalid fields", e.error_count())
+            return False
+        return True
     
-    def _extract_json(self, text: str) -> Dict:
+    def _extract_json(self, text_b: bytes) -> Dict:
         """
-        Extract JSON from Gemini response with multiple fallback strategies.
+        Extract JSON from the UTF-8 encoded Gemini response with multiple
+        fallback strategies. Works on bytes throughout so strip, find and
+        rfind run as plain byte searches.
         """
-        text = text.strip()
+        text_b = text_b.strip()
+        
+        # Fast path: response is a single fenced block (```json ... ```).
+        # Slice between the opening fence line and the closing fence without
+        # touching the regex engine.
+        if text_b.startswith(b'```'):
+            nl = text_b.find(b'\n')
+            end = text_b.rfind(b'```')
+            if nl != -1 and end > nl:
+                try:
+                    return orjson.loads(text_b[nl + 1:end].strip())
+                except orjson.JSONDecodeError:
+                    pass
         
         # Strategy 1: Try parsing as-is (if response is pure JSON)
         try:
-            return json.loads(text)
-        except json.JSONDecodeError:
+            return orjson.loads(text_b)
+        except orjson.JSONDecodeError:
             pass
         
         # Strategy 2: Look for markdown code block (```json ... ```)
-        json_match = re.search(r'```(?:json)?\s*(\{[\s\S]*?\})\s*```', text)
+        json_match = _JSON_BLOCK_RE.search(text_b)
         if json_match:
             try:
-                return json.loads(json_match.group(1))
-            except json.JSONDecodeError as e:
-                logger.warning(f"Failed to parse markdown JSON: {e}")
+                return orjson.loads(json_match.group(1))
+            except orjson.JSONDecodeError as e:
+                logger.warning("Failed to parse markdown JSON: %s", e)
         
         # Strategy 3: Find first { and last } (handles wrapped responses)
-        first_brace = text.find('{')
-        last_brace = text.rfind('}')
+        first_brace = text_b.find(b'{')
+        last_brace = text_b.rfind(b'}')
         
         if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
             try:
-                json_str = text[first_brace:last_brace + 1]
-                return json.loads(json_str)
-            except json.JSONDecodeError as e:
-                logger.warning(f"Failed to parse extracted JSON: {e}")
+                return orjson.loads(text_b[first_brace:last_brace + 1])
+            except orjson.JSONDecodeError as e:
+                logger.warning("Failed to parse extracted JSON: %s", e)
         
         # If all strategies fail, raise error with full context
-        logger.error(f"Could not extract valid JSON from: {text[:500]}")
+        logger.error("Could not extract valid JSON from: %s", text_b[:500].decode('utf-8', 'replace'))
         raise ValueError("Could not extract valid JSON from Gemini response")
     
-    def _process_gemini_response(self, gemini_result: Dict, original_items: List[Dict]) -> Dict:
+    def _process_gemini_response(self, gemini_result: Dict, original_items: List[ItemInput]) -> Dict:
         """
         Post-processes Gemini response to ensure consistency and calculate derived fields.
         """
-        processed_items = []
+        # Built in reverse so duplicate ids resolve to the first occurrence
+        original_by_id = {i.itemId: i for i in reversed(original_items)}
         
         items_from_gemini = gemini_result.get("items", [])
-        logger.info(f"Processing {len(items_from_gemini)} items from Gemini response")
+        logger.info("Processing %d items from Gemini response", len(items_from_gemini))
         
-        for item_result in items_from_gemini:
-            # Find original item to get accurate cost
-            original = next(
-                (i for i in original_items if i['itemId'] == item_result['itemId']), 
-                None
-            )
-            
-            if not original:
-                logger.warning(f"Item {item_result.get('itemId')} not found in original items")
-                continue
-            
-            current_cost = original['currentCost']
-            
-            # Process suggestions and calculate savings
-            suggestions = []
-            for sugg in item_result.get('suggestions', [])[:3]:  # Top 3 only
-                cost_savings = current_cost - sugg['estimatedCost']
-                savings_percent = (cost_savings / current_cost * 100) if current_cost > 0 else 0
-                
-                suggestions.append({
-                    "suggestedItemId": None,
-                    "name": sugg['name'],
-                    "estimatedCost": sugg['estimatedCost'],
-                    "costSavings": round(cost_savings, 2),
-                    "savingsPercent": round(savings_percent, 1),
-                    "confidence": sugg.get('confidence', 0.7),
-                    "rationale": sugg['rationale']
-                })
-            
-            # Process removal suggestion
-            never_used = item_result.get('neverUsedFlag', False)
-            removal = item_result.get('removalSuggestion', {})
+        # Original item supplies the accurate cost; unknown ids are dropped
+        processed_items = [
+            self._process_one_item(item_result, original_by_id[item_result['itemId']])
+            for item_result in items_from_gemini
+            if item_result.get('itemId') in original_by_id
+        ]
+        
+        if len(processed_items) < len(items_from_gemini):
+            missing = [
+                i.get('itemId') for i in items_from_gemini
+                if i.get('itemId') not in original_by_id
+            ]
+            logger.warning("Items %s not found in original items", missing)
+        
+        logger.info("Processed %d items successfully", len(processed_items))
+        return {"items": processed_items}
+    
+    def _process_one_item(self, item_result: Dict, original: ItemInput) -> Dict:
+        """
+        Builds the processed dict for a single Gemini item.
+        """
+        current_cost = original.currentCost
+        inv_cost = 100.0 / current_cost if current_cost > 0 else 0.0
+        
+        # Process suggestions and calculate savings
+        suggestions = []
+        for sugg in islice(item_result.get('suggestions') or (), 3):  # Top 3 only
+            cost_savings = current_cost - sugg['estimatedCost']
+            savings_percent = cost_savings * inv_cost
             
-            processed_items.append({
-                "itemId": item_result['itemId'],
-                "name": item_result['name'],
-                "currentCost": current_cost,
-                "lastUsed": original.get('lastUsed'),
-                "neverUsedFlag": never_used,
-                "suggestions": suggestions,
-                "removalSuggestion": {
-                    "recommended": removal.get('recommended', never_used),
-                    "reason": removal.get('reason'),
-                    "actionableCheckboxId": f"chk_{item_result['itemId']}" if removal.get('recommended') else None
-                }
+            suggestions.append({
+                "suggestedItemId": None,
+                "name": sugg['name'],
+                "estimatedCost": sugg['estimatedCost'],
+                "costSavings": round(cost_savings, 2),
+                # + 0.0 turns the -0.0 from a zero-cost item into 0.0
+                "savingsPercent": round(savings_percent, 1) + 0.0,
+                "confidence": sugg.get('confidence', 0.7),
+                "rationale": sugg['rationale']
             })
         
-        logger.info(f"Processed {len(processed_items)} items successfully")
-        return {"items": processed_items}
+        # Process removal suggestion
+        never_used = item_result.get('neverUsedFlag', False)
+        removal = item_result.get('removalSuggestion', {})
+        
+        return {
+            "itemId": item_result['itemId'],
+            "name": item_result['name'],
+            "currentCost": current_cost,
+            "lastUsed": original.lastUsed,
+            "neverUsedFlag": never_used,
+            "suggestions": suggestions,
+            "removalSuggestion": {
+                "recommended": removal.get('recommended', never_used),
+                "reason": removal.get('reason'),
+                "actionableCheckboxId": f"chk_{item_result['itemId']}" if removal.get('recommended') else None
+            }
+        }
 
 gemini_service = GeminiService()
 
@@ -1,16 +1,16 @@
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
-import traceback
 
 from app.config import get_settings
 from app.models import (
     SuggestionRequest, 
     SuggestionResponse, 
-    ItemAnalysis,
+    ItemAnalysisList,
     UIHints,
     MetaInfo,
     RemovalRequest
@@ -25,6 +25,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Separator logged around each suggestion request
+_BANNER = "=" * 60
+
 settings = get_settings()
 
 app = FastAPI(
@@ -37,16 +40,22 @@ app = FastAPI(
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=settings.ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
+    max_age=settings.CORS_MAX_AGE,
 )
 
+def _utc_timestamp() -> str:
+    """Second-precision UTC timestamp for health and error payloads."""
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
 # Health Check
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    return {"status": "healthy", "timestamp": _utc_timestamp()}
 
 
 @app.get("/")
@@ -59,6 +68,9 @@ async def root():
 
 
 # Main Suggestion Endpoint
+# response_model only documents the schema here: the handler returns the
+# already-validated model serialized by pydantic, so FastAPI skips
+# re-validating the output.
 @app.post("/api/spc/suggestions", response_model=SuggestionResponse)
 async def generate_suggestions(request: SuggestionRequest):
     """
@@ -73,65 +85,58 @@ async def generate_suggestions(request: SuggestionRequest):
     start_time = time.time()
     
     try:
-        logger.info("=" * 60)
-        logger.info(f"📥 New request received")
-        logger.info(f"SPC ID: {request.spcId}")
-        logger.info(f"Sub-grid: {request.subGrid}")
-        logger.info(f"Items count: {len(request.items)}")
-        logger.info(f"Procedure type: {request.procedureType}")
+        logger.info(_BANNER)
+        logger.info("📥 New request received")
+        logger.info("SPC ID: %s", request.spcId)
+        logger.info("Sub-grid: %s", request.subGrid)
+        logger.info("Items count: %d", len(request.items))
+        logger.info("Procedure type: %s", request.procedureType)
         
         # Validate input
         if not request.items:
             raise HTTPException(status_code=400, detail="No items provided for analysis")
         
-        if len(request.items) > 50:
-            raise HTTPException(status_code=400, detail="Maximum 50 items per request")
-        
-        # Convert items to dict for Gemini
-        items_dict = [item.model_dump() for item in request.items]
-        logger.info(f"✓ Items converted to dict format")
-        
         # Call Gemini Service
         logger.info("🤖 Calling Gemini API...")
         gemini_result = await gemini_service.generate_suggestions(
-            items=items_dict,
+            items=request.items,
             sub_grid=request.subGrid,
             procedure_type=request.procedureType
         )
-        logger.info(f"✓ Gemini API call successful")
+        logger.info("✓ Gemini API call successful")
+        processed_dicts = gemini_result['items']
         
-        # Map to response model
-        items_analyzed = [
-            ItemAnalysis(**item_data) 
-            for item_data in gemini_result['items']
-        ]
-        logger.info(f"✓ Analyzed {len(items_analyzed)} items")
+        # Validate Gemini's processed items against the response model
+        items_analyzed = ItemAnalysisList.validate_python(processed_dicts)
+        logger.info("✓ Analyzed %d items", len(items_analyzed))
         
-        # Generate human-readable summary
-        summary_data = [item.model_dump() for item in items_analyzed]
-        summary = build_summary_prompt(summary_data)
+        # Generate human-readable summary from the post-processed dicts
+        # (no need to dump the models we just built back to dicts)
+        summary = build_summary_prompt(processed_dicts)
         
-        # Identify priority items (highest savings + removal candidates)
+        # Identify priority items (highest savings + removal candidates), top 5
         priority_items = []
         for item in items_analyzed:
-            if item.suggestions:
-                max_savings = max([s.costSavings for s in item.suggestions])
-                if max_savings > 50:  # $50+ savings
-                    priority_items.append(item.itemId)
-            if item.removalSuggestion.recommended:
+            if item.removalSuggestion.recommended or (
+                item.suggestions
+                and max(s.costSavings for s in item.suggestions) > 50  # $50+ savings
+            ):
                 priority_items.append(item.itemId)
+                if len(priority_items) == 5:
+                    break
         
         # Build response
         execution_time_ms = int((time.time() - start_time) * 1000)
         
-        response = SuggestionResponse(
+        # itemsAnalyzed was validated above; construct skips a second pass
+        response = SuggestionResponse.model_construct(
             spcId=request.spcId,
             subGrid=request.subGrid,
             itemsAnalyzed=items_analyzed,
             summary=summary,
             uiHints=UIHints(
                 displayMode="panel",
-                priorityItems=priority_items[:5],  # Top 5
+                priorityItems=priority_items,
                 pagination={"page": 1, "pageSize": len(items_analyzed)}
             ),
             meta=MetaInfo(
@@ -141,18 +146,16 @@ async def generate_suggestions(request: SuggestionRequest):
             )
         )
         
-        logger.info(f"✅ Request completed in {execution_time_ms}ms")
-        logger.info("=" * 60)
-        return response
+        logger.info("✅ Request completed in %dms", execution_time_ms)
+        logger.info(_BANNER)
+        return Response(response.model_dump_json(), media_type="application/json")
         
     except ValueError as e:
-        logger.error(f"❌ Validation error: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception("❌ Validation error: %s", e)
         raise HTTPException(status_code=422, detail=str(e))
     
     except Exception as e:
-        logger.error(f"❌ Unexpected error: {e}")
-        logger.error(f"Full traceback:\n{traceback.format_exc()}")
+        logger.exception("❌ Unexpected error: %s", e)
         raise HTTPException(
             status_code=500, 
             detail=f"Internal server error: {str(e)}"
@@ -171,7 +174,7 @@ async def remove_items(request: RemovalRequest):
     3. Call Dynamics Web API to soft-delete
     4. Audit log the removal
     """
-    logger.info(f"Removal request received for {len(request.itemsToRemove)} items (not implemented yet)")
+    logger.info("Removal request received for %d items (not implemented yet)", len(request.itemsToRemove))
     
     return {
         "status": "not_implemented",
@@ -183,26 +186,42 @@ async def remove_items(request: RemovalRequest):
 # Error Handler
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    logger.error(f"HTTP Exception: {exc.status_code} - {exc.detail}")
+    logger.error("HTTP Exception: %s - %s", exc.status_code, exc.detail)
     return JSONResponse(
         status_code=exc.status_code,
         content={
             "error": exc.detail,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": _utc_timestamp()
+        }
+    )
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    # Leave out the offending "input" so an oversized body is not echoed back
+    errors = [
+        {"type": e["type"], "loc": e["loc"], "msg": e["msg"]}
+        for e in exc.errors()
+    ]
+    logger.error("Request validation failed: %s", errors)
+    return JSONResponse(
+        status_code=422,
+        content={
+            "error": errors,
+            "timestamp": _utc_timestamp()
         }
     )
 
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Unhandled exception: {exc}")
-    logger.error(traceback.format_exc())
+    logger.error("Unhandled exception: %s", exc, exc_info=exc)
     return JSONResponse(
         status_code=500,
         content={
             "error": "Internal server error",
             "detail": str(exc),
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": _utc_timestamp()
         }
     )
 
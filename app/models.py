@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import List, Optional, Literal
 from datetime import datetime
 
@@ -15,7 +15,7 @@ class ItemInput(BaseModel):
 class SuggestionRequest(BaseModel):
     spcId: str
     subGrid: Literal["Supplies", "Instruments", "Medicine", "CardSummary"]
-    items: List[ItemInput]
+    items: List[ItemInput] = Field(max_length=50)  # Rejected at item 51, rest never validated
     procedureType: Optional[str] = None  # e.g., "COLONOSCOPY"
     facilityId: Optional[str] = None
 
@@ -43,6 +43,9 @@ class ItemAnalysis(BaseModel):
     suggestions: List[AlternativeSuggestion] = []
     removalSuggestion: RemovalSuggestion
 
+# Validates a whole list of processed items in one pydantic-core call
+ItemAnalysisList = TypeAdapter(List[ItemAnalysis])
+
 class UIHints(BaseModel):
     displayMode: Literal["embed", "panel", "modal", "sidepanel"] = "panel"
     priorityItems: List[str] = []  # Item IDs to highlight
@@ -1,11 +1,10 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
+from functools import lru_cache
+import orjson
 
-def build_suggestion_prompt(items: List[Dict], sub_grid: str, procedure_type: str = None) -> str:
-    """
-    Builds a structured prompt for Gemini to generate cost-effective alternatives.
-    """
-    
-    context = f"""You are a medical supply cost optimization expert analyzing a Surgical Preference Card (SPC) for {procedure_type or 'a surgical procedure'}.
+from app.models import ItemInput
+
+_CONTEXT_TMPL = """You are a medical supply cost optimization expert analyzing a Surgical Preference Card (SPC) for {procedure_type}.
 
 Your task: For each item listed below, suggest 3 cost-effective alternative products that:
 1. Serve the same clinical purpose
@@ -24,19 +23,7 @@ IMPORTANT RULES:
 ITEM CATEGORY: {sub_grid}
 """
 
-    items_json = "[\n"
-    for idx, item in enumerate(items):
-        items_json += f"""  {{
-    "itemId": "{item['itemId']}",
-    "name": "{item['name']}",
-    "currentCost": {item['currentCost']},
-    "lastUsed": {f'"{item["lastUsed"]}"' if item.get('lastUsed') else 'null'},
-    "catalogNo": {f'"{item.get("catalogNo", "")}"' if item.get('catalogNo') else 'null'}
-  }}{',' if idx < len(items) - 1 else ''}
-"""
-    items_json += "]"
-
-    schema = """{
+_SCHEMA = """{
   "items": [
     {
       "itemId": "string",
@@ -59,28 +46,81 @@ ITEM CATEGORY: {sub_grid}
   ]
 }"""
 
-    return f"""{context}
-
-ITEMS TO ANALYZE:
-{items_json}
+# Everything after the items block is static, so it is assembled once here
+_PROMPT_TAIL = f"""
 
 REQUIRED OUTPUT SCHEMA:
-{schema}
+{_SCHEMA}
 
 Generate suggestions now in valid JSON format:"""
 
 
+@lru_cache(maxsize=64)
+def _context_for(sub_grid: str, procedure_type: Optional[str]) -> str:
+    """
+    Formats the instruction block; it only varies by sub-grid and procedure.
+    """
+    return _CONTEXT_TMPL.format(
+        procedure_type=procedure_type or 'a surgical procedure',
+        sub_grid=sub_grid
+    )
+
+
+def build_suggestion_prompt(items: List[ItemInput], sub_grid: str, procedure_type: str = None) -> str:
+    """
+    Builds a structured prompt for Gemini to generate cost-effective alternatives.
+    """
+    
+    context = _context_for(sub_grid, procedure_type)
+
+    payload = [
+        {
+            "itemId": item.itemId,
+            "name": item.name,
+            "currentCost": item.currentCost,
+            "lastUsed": item.lastUsed or None,
+            "catalogNo": item.catalogNo or None
+        }
+        for item in items
+    ]
+    items_json = orjson.dumps(payload).decode()
+
+    return "".join((context, "\n\nITEMS TO ANALYZE:\n", items_json, _PROMPT_TAIL))
+
+
 def build_summary_prompt(analysis_results: List[Dict]) -> str:
     """
     Generates a human-readable summary after analysis.
     """
     total_items = len(analysis_results)
-    items_with_suggestions = sum(1 for item in analysis_results if item.get('suggestions'))
-    removal_candidates = sum(1 for item in analysis_results if item.get('neverUsedFlag'))
+    items_with_suggestions = removal_candidates = 0
+    total_potential_savings = 0.0
     
-    total_potential_savings = sum(
-        max([s['costSavings'] for s in item['suggestions']], default=0)
-        for item in analysis_results if item.get('suggestions')
-    )
+    # Single pass over the results for all three aggregates
+    for item in analysis_results:
+        suggestions = item.get('suggestions')
+        if suggestions:
+            items_with_suggestions += 1
+            best = suggestions[0]['costSavings']
+            for s in suggestions:
+                if s['costSavings'] > best:
+                    best = s['costSavings']
+            total_potential_savings += best
+        if item.get('neverUsedFlag'):
+            removal_candidates += 1
     
+    return format_summary(
+        total_items, items_with_suggestions, total_potential_savings, removal_candidates
+    )
+
+
+def format_summary(
+    total_items: int,
+    items_with_suggestions: int,
+    total_potential_savings: float,
+    removal_candidates: int
+) -> str:
+    """
+    Formats the human-readable summary from precomputed aggregates.
+    """
     return f"""Analyzed {total_items} items. Found cost-saving alternatives for {items_with_suggestions} items with potential savings of ${total_potential_savings:.2f}. Identified {removal_candidates} never-used items recommended for removal."""
\ No newline at end of file
@@ -1,22 +1,28 @@
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+import os
 import time
-from datetime import datetime
+import heapq
+from operator import itemgetter
+from datetime import datetime, timezone
 import logging
-import traceback
 
 from app.config import get_settings
 from app.models import (
     SuggestionRequest, 
     SuggestionResponse, 
     ItemAnalysis,
+    ItemAnalysisList,
+    AlternativeSuggestion,
+    RemovalSuggestion,
     UIHints,
     MetaInfo,
     RemovalRequest
 )
 from app.gemini_service import gemini_service
-from app.prompts import build_summary_prompt
+from app.prompts import format_summary
 
 # Configure logging
 logging.basicConfig(
@@ -25,7 +31,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Separator logged around each suggestion request
+_BANNER = "=" * 60
+
 settings = get_settings()
+# Invariants read on every request, bound once at import
+_GEMINI_MODEL = settings.GEMINI_MODEL
+_API_VERSION = settings.API_VERSION
+_TRUST_GEMINI_SCHEMA = settings.TRUST_GEMINI_SCHEMA
 
 app = FastAPI(
     title=settings.API_TITLE,
@@ -37,23 +50,50 @@ app = FastAPI(
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=settings.ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
+    max_age=settings.CORS_MAX_AGE,
 )
 
+# (epoch second, ISO string) - timestamps are formatted at most once a second
+_iso_cache = (0, "")
+
+
+def _iso_now() -> str:
+    global _iso_cache
+    now = int(time.time())
+    if now != _iso_cache[0]:
+        _iso_cache = (now, datetime.fromtimestamp(now, timezone.utc).isoformat())
+    return _iso_cache[1]
+
+
+def _construct_item_analysis(item_data: dict) -> ItemAnalysis:
+    """
+    Builds an ItemAnalysis from trusted post-processed data without validation.
+    model_construct does not recurse, so nested models are constructed here.
+    """
+    return ItemAnalysis.model_construct(**{
+        **item_data,
+        "suggestions": [
+            AlternativeSuggestion.model_construct(**s) for s in item_data["suggestions"]
+        ],
+        "removalSuggestion": RemovalSuggestion.model_construct(**item_data["removalSuggestion"])
+    })
+
+
 # Health Check
 @app.get("/health", tags=["System"])
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    return {"status": "healthy", "timestamp": _iso_now()}
 
 
 @app.get("/", tags=["System"])
 async def root():
     return {
         "message": "SPC Suggestion API is running",
-        "version": settings.API_VERSION,
+        "version": _API_VERSION,
         "docs": "/api/docs"
     }
 
@@ -70,53 +110,64 @@ async def generate_suggestions(request: SuggestionRequest):
     start_time = time.time()
     
     try:
-        logger.info("=" * 60)
+        logger.info(_BANNER)
         logger.info("📥 New request received")
-        logger.info(f"SPC ID: {request.spcId}")
-        logger.info(f"Sub-grid: {request.subGrid}")
-        logger.info(f"Items count: {len(request.items)}")
-        logger.info(f"Procedure type: {request.procedureType}")
+        logger.info("SPC ID: %s", request.spcId)
+        logger.info("Sub-grid: %s", request.subGrid)
+        logger.info("Items count: %d", len(request.items))
+        logger.info("Procedure type: %s", request.procedureType)
         
         # Validate input
         if not request.items:
             raise HTTPException(status_code=400, detail="No items provided for analysis")
         
-        if len(request.items) > 50:
-            raise HTTPException(status_code=400, detail="Maximum 50 items per request")
-        
-        # Convert items to dict for Gemini
-        items_dict = [item.model_dump() for item in request.items]
-        logger.info("✓ Items converted to dict format")
-        
         # Call Gemini Service
         logger.info("🤖 Calling Gemini API...")
         gemini_result = await gemini_service.generate_suggestions(
-            items=items_dict,
+            items=request.items,
             sub_grid=request.subGrid,
             procedure_type=request.procedureType
         )
         logger.info("✓ Gemini API call successful")
         
-        # Map to response model
-        items_analyzed = [
-            ItemAnalysis(**item_data) 
-            for item_data in gemini_result['items']
-        ]
-        logger.info(f"✓ Analyzed {len(items_analyzed)} items")
-        
-        # Generate human-readable summary
-        summary_data = [item.model_dump() for item in items_analyzed]
-        summary = build_summary_prompt(summary_data)
+        # Map to response model (one batch validation call unless trusted)
+        if _TRUST_GEMINI_SCHEMA:
+            items_analyzed = [_construct_item_analysis(d) for d in gemini_result['items']]
+        else:
+            items_analyzed = ItemAnalysisList.validate_python(gemini_result['items'])
         
-        # Identify priority items
-        priority_items = []
+        # Collect priority items and summary aggregates in a single pass
+        priority_candidates = []  # (score, itemId), one entry per item
+        items_with_suggestions = removal_candidates = 0
+        total_potential_savings = 0.0
         for item in items_analyzed:
+            max_savings = 0
             if item.suggestions:
-                max_savings = max([s.costSavings for s in item.suggestions])
-                if max_savings > 50:
-                    priority_items.append(item.itemId)
+                items_with_suggestions += 1
+                max_savings = max(s.costSavings for s in item.suggestions)
+                total_potential_savings += max_savings
+            if item.neverUsedFlag:
+                removal_candidates += 1
             if item.removalSuggestion.recommended:
-                priority_items.append(item.itemId)
+                # Removal candidates rank ahead of any savings-only item
+                priority_candidates.append((max_savings + 1e9, item.itemId))
+            elif max_savings > 50:
+                priority_candidates.append((max_savings, item.itemId))
+        logger.info("✓ Analyzed %d items", len(items_analyzed))
+        
+        # Top 5 priority items by score (ties keep input order)
+        priority_items = [
+            item_id for _, item_id
+            in heapq.nlargest(5, priority_candidates, key=itemgetter(0))
+        ]
+        
+        # Generate human-readable summary
+        summary = format_summary(
+            len(items_analyzed),
+            items_with_suggestions,
+            total_potential_savings,
+            removal_candidates
+        )
         
         # Build response
         execution_time_ms = int((time.time() - start_time) * 1000)
@@ -128,28 +179,26 @@ async def generate_suggestions(request: SuggestionRequest):
             summary=summary,
             uiHints=UIHints(
                 displayMode="panel",
-                priorityItems=priority_items[:5],
+                priorityItems=priority_items,
                 pagination={"page": 1, "pageSize": len(items_analyzed)}
             ),
             meta=MetaInfo(
                 generatedAt=datetime.utcnow(),
-                model=settings.GEMINI_MODEL,
+                model=_GEMINI_MODEL,
                 executionMs=execution_time_ms
             )
         )
         
-        logger.info(f"✅ Request completed in {execution_time_ms}ms")
-        logger.info("=" * 60)
+        logger.info("✅ Request completed in %dms", execution_time_ms)
+        logger.info(_BANNER)
         return response
         
     except ValueError as e:
-        logger.error(f"❌ Validation error: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception("❌ Validation error: %s", e)
         raise HTTPException(status_code=422, detail=str(e))
     
     except Exception as e:
-        logger.error(f"❌ Unexpected error: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception("❌ Unexpected error: %s", e)
         raise HTTPException(
             status_code=500, 
             detail=f"Internal server error: {str(e)}"
@@ -159,7 +208,7 @@ async def generate_suggestions(request: SuggestionRequest):
 # Removal Endpoint (Phase 2 - Placeholder)
 @app.post("/api/spc/remove-items", tags=["Suggestions"])
 async def remove_items(request: RemovalRequest):
-    logger.info(f"Removal request received for {len(request.itemsToRemove)} items (not implemented yet)")
+    logger.info("Removal request received for %d items (not implemented yet)", len(request.itemsToRemove))
     
     return {
         "status": "not_implemented",
@@ -171,26 +220,42 @@ async def remove_items(request: RemovalRequest):
 # Error Handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    logger.error(f"HTTP Exception: {exc.status_code} - {exc.detail}")
+    logger.error("HTTP Exception: %s - %s", exc.status_code, exc.detail)
     return JSONResponse(
         status_code=exc.status_code,
         content={
             "error": exc.detail,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": _iso_now()
+        }
+    )
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    # Leave out the offending "input" so an oversized body is not echoed back
+    errors = [
+        {"type": e["type"], "loc": e["loc"], "msg": e["msg"]}
+        for e in exc.errors()
+    ]
+    logger.error("Request validation failed: %s", errors)
+    return JSONResponse(
+        status_code=422,
+        content={
+            "error": errors,
+            "timestamp": _iso_now()
         }
     )
 
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Unhandled exception: {exc}")
-    logger.error(traceback.format_exc())
+    logger.error("Unhandled exception: %s", exc, exc_info=exc)
     return JSONResponse(
         status_code=500,
         content={
             "error": "Internal server error",
             "detail": str(exc),
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": _iso_now()
         }
     )
 
@@ -198,4 +263,13 @@ async def general_exception_handler(request: Request, exc: Exception):
 if __name__ == "__main__":
     import uvicorn
     logger.info("🚀 Starting SPC Suggestion API...")
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+    # Workers need an import string so each process can load the app itself.
+    # loop/http stay on "auto", which already picks uvloop and httptools when
+    # they are installed (uvicorn[standard]) and falls back cleanly otherwise.
+    uvicorn.run(
+        "app.sample:app",
+        host="0.0.0.0",
+        port=8000,
+        log_level="info",
+        workers=int(os.getenv("WEB_CONCURRENCY", "4"))
+    )
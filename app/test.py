@@ -3,6 +3,7 @@ Quick script to test Gemini API and list available models
 """
 import google.generativeai as genai
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -22,12 +23,16 @@ print("=" * 60)
 # List available models
 print("\n📋 Available Models:")
 print("-" * 60)
+lines = []
 for model in genai.list_models():
-    if 'generateContent' in model.supported_generation_methods:
-        print(f"✓ {model.name}")
-        print(f"  Display Name: {model.display_name}")
-        print(f"  Description: {model.description[:100]}...")
-        print()
+    if 'generateContent' not in model.supported_generation_methods:
+        continue
+    lines.append(
+        f"✓ {model.name}\n"
+        f"  Display Name: {model.display_name}\n"
+        f"  Description: {model.description[:100]}...\n\n"
+    )
+sys.stdout.write("".join(lines))
 
 # Test a simple generation
 print("\n🧪 Testing Simple Generation:")
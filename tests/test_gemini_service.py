@@ -0,0 +1,93 @@
+"""
+Regression checks for GeminiService's response cache.
+
+google.generativeai is replaced with a fake before app.gemini_service is
+imported, so these run without the SDK or network access.
+"""
+import asyncio
+import os
+import sys
+import types
+
+import orjson
+import pytest
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+
+class _FakeModel:
+    """Returns queued replies and counts generate_content_async calls."""
+
+    def __init__(self, **kwargs):
+        self.replies = []
+        self.calls = 0
+
+    async def generate_content_async(self, prompt):
+        self.calls += 1
+        text = orjson.dumps(self.replies.pop(0)).decode()
+        part = types.SimpleNamespace(text=text)
+        candidate = types.SimpleNamespace(
+            finish_reason="STOP",
+            content=types.SimpleNamespace(parts=[part])
+        )
+        return types.SimpleNamespace(candidates=[candidate])
+
+
+@pytest.fixture
+def service(monkeypatch):
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = _FakeModel
+    google = types.ModuleType("google")
+    google.generativeai = genai
+    monkeypatch.setitem(sys.modules, "google", google)
+    monkeypatch.setitem(sys.modules, "google.generativeai", genai)
+    monkeypatch.delitem(sys.modules, "app.gemini_service", raising=False)
+
+    from app.gemini_service import GeminiService
+    return GeminiService()
+
+
+def _reply(confidence):
+    return {
+        "items": [{
+            "itemId": "A1",
+            "name": "Gauze",
+            "suggestions": [{
+                "name": "Generic Gauze",
+                "estimatedCost": 4.0,
+                "confidence": confidence,
+                "rationale": "Same spec"
+            }],
+            "removalSuggestion": {"recommended": False, "reason": None}
+        }]
+    }
+
+
+def _suggest(service, items):
+    return asyncio.run(service.generate_suggestions(items, "Supplies"))
+
+
+def test_invalid_reply_is_not_cached(service):
+    from app.models import ItemInput
+    items = [ItemInput(itemId="A1", name="Gauze", currentCost=5.0)]
+    service.model.replies = [_reply(1.5), _reply(0.8)]
+
+    _suggest(service, items)
+    assert len(service._cache) == 0
+
+    result = _suggest(service, items)
+    assert service.model.calls == 2
+    assert result["items"][0]["suggestions"][0]["confidence"] == 0.8
+    assert len(service._cache) == 1
+
+
+def test_valid_reply_is_served_from_cache(service):
+    from app.models import ItemInput
+    items = [ItemInput(itemId="A1", name="Gauze", currentCost=5.0)]
+    service.model.replies = [_reply(0.8)]
+
+    first = _suggest(service, items)
+    second = _suggest(service, items)
+    assert service.model.calls == 1
+    assert second == first